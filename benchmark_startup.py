@@ -0,0 +1,175 @@
+# Webhookサーバーと create_excel.py の起動時間とメモリ使用量を計測するスクリプト
+# python -X importtime を使ってモジュールごとの読み込み時間も集計する
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 計測対象（名前, python -X importtime に渡す引数, 使用するDATA_DIRの種類）
+# Webhookサーバーは起動すると終了しないため、サーバー起動前までの読み込みを計測する
+TARGETS = [
+    ("python", ["-c", "pass"], "empty"),
+    ("synology_chat (読み込みのみ)", ["-c", "import synology_chat"], "empty"),
+    ("create_excel.py (ファイルなし)", ["create_excel.py"], "empty"),
+    ("create_excel.py (Excel作成時)", ["create_excel.py"], "messages"),
+]
+
+
+# 現在の期間のメッセージファイルを作成するコード（引数: DATA_DIR, メッセージ数）
+# 期間とファイル名の規則は create_excel.py と同じものを使用する
+SAMPLE_MESSAGES_CODE = """
+import json, os, sys
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from create_excel import TIMEZONE, get_period_filename, get_period_start_end
+
+data_dir, count = sys.argv[1], int(sys.argv[2])
+now = datetime.now(ZoneInfo(TIMEZONE))
+start_date, end_date = get_period_start_end(now)
+messages = [
+    {
+        "username": f"user{i % 5}",
+        "text": f"本日の業務を開始します #tag{i % 3}",
+        "received_at": now.isoformat(),
+    }
+    for i in range(count)
+]
+json_file = os.path.join(data_dir, get_period_filename(start_date, end_date))
+with open(json_file, "w", encoding="utf-8") as f:
+    json.dump(messages, f, ensure_ascii=False)
+"""
+
+
+def write_sample_messages(data_dir, count, env):
+    """現在の期間のメッセージファイルをDATA_DIRに作成する
+
+    計測するプロセスのRSSにこのスクリプトのメモリが含まれないよう、
+    create_excel の読み込みは別プロセスで行う。
+    """
+    subprocess.run(
+        [sys.executable, "-c", SAMPLE_MESSAGES_CODE, data_dir, str(count)],
+        cwd=SCRIPT_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+
+def get_rss_kib(usage):
+    """rusageの最大RSSをKiB単位で取得（macOSではバイト単位のため変換する）"""
+    if sys.platform == "darwin":
+        return usage.ru_maxrss // 1024
+    return usage.ru_maxrss
+
+
+def run_target(args, env):
+    """新しいPythonプロセスで実行し、経過時間・最大RSS（KiB）・importtimeを返す"""
+    with tempfile.TemporaryFile("w+") as stdout, tempfile.TemporaryFile("w+") as stderr:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-X", "importtime", *args],
+            cwd=SCRIPT_DIR,
+            env=env,
+            stdout=stdout,
+            stderr=stderr,
+        )
+        # 子プロセスごとの最大RSSを取得するため、wait4で終了を待つ
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - started
+        process.returncode = os.waitstatus_to_exitcode(status)
+
+        stderr.seek(0)
+        output = stderr.read()
+
+    if process.returncode != 0:
+        raise RuntimeError(output.strip().splitlines()[-1])
+    return elapsed, get_rss_kib(usage), parse_importtime(output)
+
+
+def parse_importtime(output):
+    """importtimeの出力から、トップレベルとその直下のimportの累積時間（マイクロ秒）を取得"""
+    imports = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # 入れ子のimportは1段ごとに2文字インデントされる
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth > 1:
+            continue
+        imports[name.strip()] = int(cumulative)
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="起動時間とメモリ使用量を計測")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数")
+    parser.add_argument("--top", type=int, default=10, help="表示するimportの件数")
+    parser.add_argument(
+        "--messages", type=int, default=200, help="Excel作成時に使用するメッセージ数"
+    )
+    args = parser.parse_args()
+
+    empty_dir = tempfile.TemporaryDirectory()
+    messages_dir = tempfile.TemporaryDirectory()
+    with empty_dir, messages_dir:
+        # create_excel.py は絶対パスのDATA_DIRをそのまま使用する。
+        # OpenAI APIとWebDAVの設定は空文字にして、.envの値が読み込まれても通信しないようにする
+        base_env = dict(
+            os.environ,
+            OPENAI_API_KEY="",
+            WEBDAV_URL="",
+            WEBDAV_USERNAME="",
+            WEBDAV_PASSWORD="",
+        )
+        envs = {
+            "empty": dict(base_env, DATA_DIR=empty_dir.name),
+            "messages": dict(base_env, DATA_DIR=messages_dir.name),
+        }
+
+        try:
+            write_sample_messages(messages_dir.name, args.messages, base_env)
+        except subprocess.CalledProcessError as e:
+            error = e.stderr.strip().splitlines()[-1]
+            print(f"メッセージファイルの作成に失敗しました: {error}\n")
+            # ファイルがないとExcel作成時の計測にならないため対象から外す
+            del envs["messages"]
+
+        for name, target_args, data_dir_kind in TARGETS:
+            env = envs.get(data_dir_kind)
+            if env is None:
+                continue
+            print(f"== {name}: {' '.join(target_args)}")
+            try:
+                results = [
+                    run_target(target_args, env) for _ in range(args.repeat)
+                ]
+            except RuntimeError as e:
+                print(f"  計測に失敗しました: {e}\n")
+                continue
+
+            times = [elapsed * 1000 for elapsed, _, _ in results]
+            rss = [rss_kib / 1024 for _, rss_kib, _ in results]
+            print(
+                f"  起動時間: 中央値 {statistics.median(times):.1f} ms, "
+                f"最小 {min(times):.1f} ms ({args.repeat}回)"
+            )
+            print(f"  最大RSS: {statistics.median(rss):.1f} MiB")
+
+            # 最後の計測結果から、読み込みに時間がかかったモジュールを表示
+            imports = results[-1][2]
+            slowest = sorted(imports.items(), key=lambda item: item[1], reverse=True)
+            for module, cumulative in slowest[: args.top]:
+                print(f"    {cumulative / 1000:8.1f} ms  {module}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# チャンネルとトークンの設定を扱う機能
+# synology_chat.py と create_excel.py で同じ設定を同じ規則で解釈するために使用する
+
+import hashlib
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# SYNOLOGY_CHAT_TOKEN のみで運用する場合のチャンネル名（DATA_DIR直下に保存）
+DEFAULT_CHANNEL = "default"
+
+# チャンネル名として使用できる文字（保存先ディレクトリ名になるため制限する）
+CHANNEL_NAME_PATTERN = re.compile(r"[\w-]+")
+
+
+def token_digest(value):
+    """トークンをハッシュ化して辞書のキーにする"""
+    return hashlib.sha256(value.encode("utf-8")).digest()
+
+
+def load_channel_tokens(tokens_setting, legacy_token=None):
+    """トークンとチャンネルの対応表を作成する
+
+    tokens_setting は "チャンネル名:トークン" をカンマ区切りで指定する。
+    例: SYNOLOGY_CHAT_TOKENS=sales:xxxx,dev:yyyy
+    legacy_token には従来の SYNOLOGY_CHAT_TOKEN を指定する（DEFAULT_CHANNEL として扱う）。
+    DEFAULT_CHANNEL は legacy_token 専用のため、tokens_setting では使用できない。
+
+    戻り値はトークンのハッシュ値 -> (トークン, チャンネル名) の辞書。
+    同じトークンが異なるチャンネルに設定されている場合や、
+    DEFAULT_CHANNEL が指定された場合は ValueError を送出する。
+    """
+    entries = []
+    for position, entry in enumerate((tokens_setting or "").split(","), start=1):
+        entry = entry.strip()
+        if not entry:
+            continue
+        channel, _, channel_token = entry.partition(":")
+        channel = channel.strip()
+        channel_token = channel_token.strip()
+        # トークンがログに残らないよう、設定の内容ではなく位置のみを出力する
+        if not channel_token or not CHANNEL_NAME_PATTERN.fullmatch(channel):
+            logger.warning(f"{position}番目のチャンネル設定が不正なため無視します")
+            continue
+        if channel == DEFAULT_CHANNEL:
+            raise ValueError(
+                f"チャンネル名 {DEFAULT_CHANNEL} は SYNOLOGY_CHAT_TOKEN 用に"
+                f"予約されています"
+            )
+        entries.append((channel, channel_token))
+
+    # 従来の単一トークン設定も引き続き受け付ける
+    if legacy_token:
+        entries.append((DEFAULT_CHANNEL, legacy_token))
+
+    channel_tokens = {}
+    for channel, channel_token in entries:
+        digest = token_digest(channel_token)
+        existing = channel_tokens.get(digest)
+        if existing is not None and existing[1] != channel:
+            raise ValueError(
+                f"同じトークンが複数のチャンネルに設定されています: "
+                f"{existing[1]}, {channel}"
+            )
+        channel_tokens[digest] = (channel_token, channel)
+
+    return channel_tokens
+
+
+def get_channel_names(channel_tokens):
+    """対応表に含まれるチャンネル名を重複なく設定順に取得"""
+    channels = []
+    for _, channel in channel_tokens.values():
+        if channel not in channels:
+            channels.append(channel)
+    return channels
+
+
+def find_channel_names(data_dir):
+    """DATA_DIRのサブディレクトリからメッセージが保存されているチャンネル名を取得
+
+    DATA_DIR直下（DEFAULT_CHANNEL）を先頭に含める。
+    """
+    channels = [DEFAULT_CHANNEL]
+    if not os.path.isdir(data_dir):
+        return channels
+    for name in sorted(os.listdir(data_dir)):
+        if name == DEFAULT_CHANNEL or not CHANNEL_NAME_PATTERN.fullmatch(name):
+            continue
+        if os.path.isdir(os.path.join(data_dir, name)):
+            channels.append(name)
+    return channels
+
+
+def get_channel_dir(data_dir, channel):
+    """チャンネルごとのメッセージ保存先ディレクトリを取得"""
+    if channel == DEFAULT_CHANNEL:
+        return data_dir
+    return os.path.join(data_dir, channel)
@@ -1,12 +1,13 @@
+import argparse
 import json
-import pandas as pd
 from datetime import datetime, date
 import re
 import os
 from zoneinfo import ZoneInfo
-import requests
 from dotenv import load_dotenv
-import openpyxl.styles
+
+from channels import DEFAULT_CHANNEL, find_channel_names, get_channel_dir
+from profiling import StageProfiler
 
 # 環境変数の読み込み
 load_dotenv()
@@ -26,17 +27,25 @@ OPENAI_API_BASE = "https://api.openai.com/v1"
 # スクリプトのディレクトリを取得
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# DATA_DIRの設定
-# Dockerコンテナ内の場合は /app/data を使用
-if os.path.exists("/app"):
-    DATA_DIR = "/app/data"
-else:
-    # 開発環境の場合は相対パスを使用
-    DATA_DIR = os.path.join(SCRIPT_DIR, DATA_DIR)
+# DATA_DIRの設定（絶対パスが指定された場合はそのまま使用）
+if not os.path.isabs(DATA_DIR):
+    # Dockerコンテナ内の場合は /app/data を使用
+    if os.path.exists("/app"):
+        DATA_DIR = "/app/data"
+    else:
+        # 開発環境の場合は相対パスを使用
+        DATA_DIR = os.path.join(SCRIPT_DIR, DATA_DIR)
 
 print(f"使用するデータディレクトリ: {DATA_DIR}")
 
 
+def get_channel_webdav_folder(channel):
+    """チャンネルごとのWebDAV上の保存先フォルダを取得"""
+    if channel == DEFAULT_CHANNEL:
+        return WEBDAV_FOLDER
+    return f"{WEBDAV_FOLDER.rstrip('/')}/{channel}"
+
+
 def get_period_start_end(dt):
     """日付から期間の開始日と終了日を取得"""
     current_date = dt.date()
@@ -97,6 +106,9 @@ def analyze_message_intent(message: str) -> str:
         print("社長予定タグを検出: startとして判定")
         return "start"
 
+    # 読み込みに時間がかかるため、使用する時点でimportする
+    import requests
+
     try:
         print(f"メッセージを分析中: {message}")
 
@@ -288,6 +300,10 @@ def process_messages():
             excel_filename = os.path.splitext(json_file)[0] + ".xlsx"
             excel_path = os.path.join(DATA_DIR, excel_filename)
 
+            # 読み込みに時間がかかるため、Excelファイルを作成する時点でimportする
+            import pandas as pd
+            import openpyxl.styles
+
             with pd.ExcelWriter(excel_path, engine="openpyxl") as writer:
                 # 各ユーザーのデータをシートとして保存
                 for username, user_messages in processed_messages.items():
@@ -355,17 +371,23 @@ def process_messages():
             continue
 
 
-def upload_to_webdav(file_path, start_date, end_date):
+def upload_to_webdav(file_path, start_date, end_date, folder=None):
     """WebDAVを使用してファイルをアップロード"""
     if not all([WEBDAV_URL, WEBDAV_USERNAME, WEBDAV_PASSWORD]):
         print("WebDAVの設定が不完全です。環境変数を確認してください。")
         return False
 
+    if folder is None:
+        folder = WEBDAV_FOLDER
+
+    # 読み込みに時間がかかるため、使用する時点でimportする
+    import requests
+
     try:
         # アップロード先のURLを構築
         filename = os.path.basename(file_path)
         encoded_folder = "/".join(
-            requests.utils.quote(part) for part in WEBDAV_FOLDER.split("/")
+            requests.utils.quote(part) for part in folder.split("/")
         )
         encoded_filename = requests.utils.quote(filename)
 
@@ -402,7 +424,7 @@ def upload_to_webdav(file_path, start_date, end_date):
                 f"{end_date.strftime('%Y/%m/%d')}"
             )
             print(f"ファイルのアップロードに成功しました: {filename}")
-            print(f"保存先: {WEBDAV_FOLDER}")
+            print(f"保存先: {folder}")
             print(f"期間: {period_str}")
             return True
         else:
@@ -417,49 +439,55 @@ def upload_to_webdav(file_path, start_date, end_date):
         return False
 
 
-def main():
-    """メインの処理を実行"""
-    # 現在の日時（タイムゾーン付き）
-    now = datetime.now(ZoneInfo(TIMEZONE))
-
-    # 期間の開始日と終了日を計算
-    start_date, end_date = get_period_start_end(now)
+def create_channel_report(channel, start_date, end_date, profiler):
+    """チャンネルのメッセージからExcelファイルを生成してアップロード"""
+    channel_dir = get_channel_dir(DATA_DIR, channel)
 
     # JSONファイルのパスを設定
     json_filename = get_period_filename(start_date, end_date)
-    json_file = os.path.join(DATA_DIR, json_filename)
+    json_file = os.path.join(channel_dir, json_filename)
 
-    print(
-        f"処理対象期間: {start_date.strftime('%Y/%m/%d')} ～ "
-        f"{end_date.strftime('%Y/%m/%d')}"
-    )
+    print(f"チャンネル: {channel}")
     print(f"対象ファイル: {json_file}")
 
     if not os.path.exists(json_file):
         print(f"メッセージファイルが見つかりません: {json_file}")
         return
 
+    # pandas・openpyxl・requests は読み込みに時間がかかるため、処理対象のファイルが
+    # ない短時間の実行では読み込まないよう、ファイルが見つかってからimportする。
+    # 意図分析の計測に読み込み時間が含まれないよう、requestsは先に読み込む
+    with profiler.stage("import_requests"):
+        import requests  # noqa: F401
+
     try:
         # JSONファイルを読み込む
-        with open(json_file, "r", encoding="utf-8") as f:
-            messages = json.load(f)
+        with profiler.stage("json_load"):
+            with open(json_file, "r", encoding="utf-8") as f:
+                messages = json.load(f)
 
         # メッセージを処理
         processed_messages = {}
         for msg in messages:
-            # タグと本文を分離
-            text = msg.get(
-                "text", msg.get("message", "")
-            )  # textフィールドがない場合はmessageフィールドを使用
-            tags, clean_text = extract_tags(text)
-            tags_str = ", ".join(tags) if tags else ""  # '#'を含めたタグをそのまま使用
+            with profiler.stage("parse"):
+                # タグと本文を分離
+                text = msg.get(
+                    "text", msg.get("message", "")
+                )  # textフィールドがない場合はmessageフィールドを使用
+                tags, clean_text = extract_tags(text)
+                tags_str = (
+                    ", ".join(tags) if tags else ""
+                )  # '#'を含めたタグをそのまま使用
 
             # 時刻を分類
             received_at = msg.get("received_at", "")
             if received_at:
                 timestamp = datetime.fromisoformat(received_at)
                 time_str = timestamp.strftime("%H:%M")
-                start_time, end_time, unknown_time = classify_time(clean_text, time_str)
+                with profiler.stage("analyze_message_intent"):
+                    start_time, end_time, unknown_time = classify_time(
+                        clean_text, time_str
+                    )
 
                 # ユーザー名でグループ化
                 username = msg.get("username", "未設定")
@@ -482,62 +510,88 @@ def main():
 
         # Excelファイルとして保存
         excel_filename = get_excel_filename(start_date, end_date)
-        excel_file = os.path.join(DATA_DIR, excel_filename)
+        excel_file = os.path.join(channel_dir, excel_filename)
 
-        with pd.ExcelWriter(excel_file, engine="openpyxl") as writer:
+        with profiler.stage("import_excel_libs"):
+            import pandas as pd
+            import openpyxl.styles
+
+        # 保存処理も計測するため、with文を使わずに明示的にcloseする
+        writer = pd.ExcelWriter(excel_file, engine="openpyxl")
+        try:
             # 各ユーザーのデータをシートとして保存
             for username, user_messages in processed_messages.items():
-                # DataFrameを作成し、列の順序を指定
-                df = pd.DataFrame(user_messages)
-                df = df[
-                    ["月", "日", "曜", "出勤時刻", "退社時刻", "不明", "タグ", "本文"]
-                ]
+                with profiler.stage("dataframe"):
+                    # DataFrameを作成し、列の順序を指定
+                    df = pd.DataFrame(user_messages)
+                    df = df[
+                        [
+                            "月",
+                            "日",
+                            "曜",
+                            "出勤時刻",
+                            "退社時刻",
+                            "不明",
+                            "タグ",
+                            "本文",
+                        ]
+                    ]
                 # シート名としてユーザー名を使用（31文字以内）
                 sheet_name = username[:31]
-                # シートとして保存（ヘッダーの太字を無効化）
-                df.to_excel(
-                    writer,
-                    index=False,
-                    sheet_name=sheet_name,
-                )
+                with profiler.stage("to_excel"):
+                    # シートとして保存（ヘッダーの太字を無効化）
+                    df.to_excel(
+                        writer,
+                        index=False,
+                        sheet_name=sheet_name,
+                    )
 
                 # ワークシートを取得
                 worksheet = writer.sheets[sheet_name]
 
-                # ヘッダーの太字を解除
-                for cell in worksheet[1]:
-                    cell.font = openpyxl.styles.Font(bold=False)
-
-                # 罫線を削除
-                for row in worksheet.iter_rows():
-                    for cell in row:
-                        cell.border = None
-
-                # 月と日の列を数値書式に設定
-                for row in worksheet.iter_rows(min_row=2):  # ヘッダー行をスキップ
-                    # A列（月）の書式設定
-                    row[0].number_format = "0"
-                    # B列（日）の書式設定
-                    row[1].number_format = "0"
-
-                # 列幅の自動調整
-                for idx, col in enumerate(df.columns):
-                    # 列の最大文字数を計算（列名と内容の両方を考慮）
-                    max_length = max(
-                        df[col].astype(str).apply(len).max(),  # 内容の最大長
-                        len(str(col)),  # 列名の長さ
-                    )
-                    # 文字幅から列幅を計算（1文字あたり1.2を掛けて余裕を持たせる）
-                    adjusted_width = max_length * 1.2
-                    # 列幅を設定（最小幅8、最大幅50）
-                    worksheet.column_dimensions[chr(65 + idx)].width = min(
-                        max(8, adjusted_width), 50
-                    )
+                with profiler.stage("openpyxl_format"):
+                    # ヘッダーの太字を解除
+                    for cell in worksheet[1]:
+                        cell.font = openpyxl.styles.Font(bold=False)
+
+                    # 罫線を削除
+                    for row in worksheet.iter_rows():
+                        for cell in row:
+                            cell.border = None
+
+                    # 月と日の列を数値書式に設定
+                    for row in worksheet.iter_rows(min_row=2):  # ヘッダー行をスキップ
+                        # A列（月）の書式設定
+                        row[0].number_format = "0"
+                        # B列（日）の書式設定
+                        row[1].number_format = "0"
+
+                    # 列幅の自動調整
+                    for idx, col in enumerate(df.columns):
+                        # 列の最大文字数を計算（列名と内容の両方を考慮）
+                        max_length = max(
+                            df[col].astype(str).apply(len).max(),  # 内容の最大長
+                            len(str(col)),  # 列名の長さ
+                        )
+                        # 文字幅から列幅を計算（1文字あたり1.2を掛けて余裕を持たせる）
+                        adjusted_width = max_length * 1.2
+                        # 列幅を設定（最小幅8、最大幅50）
+                        worksheet.column_dimensions[chr(65 + idx)].width = min(
+                            max(8, adjusted_width), 50
+                        )
+        finally:
+            with profiler.stage("excel_save"):
+                writer.close()
 
         print(f"Excelファイルを作成しました: {excel_file}")
 
         # WebDAVにアップロード
-        if upload_to_webdav(excel_file, start_date, end_date):
+        webdav_folder = get_channel_webdav_folder(channel)
+        with profiler.stage("webdav_upload"):
+            uploaded = upload_to_webdav(
+                excel_file, start_date, end_date, webdav_folder
+            )
+        if uploaded:
             print("WebDAVへのアップロードが完了しました")
         else:
             print("WebDAVへのアップロードに失敗しました")
@@ -547,5 +601,45 @@ def main():
         return
 
 
+def main(profile=False):
+    """メインの処理を実行"""
+    profiler = StageProfiler(enabled=profile)
+
+    # 現在の日時（タイムゾーン付き）
+    now = datetime.now(ZoneInfo(TIMEZONE))
+
+    # 期間の開始日と終了日を計算
+    start_date, end_date = get_period_start_end(now)
+
+    print(
+        f"処理対象期間: {start_date.strftime('%Y/%m/%d')} ～ "
+        f"{end_date.strftime('%Y/%m/%d')}"
+    )
+
+    # メッセージが保存されているチャンネルを取得（DATA_DIR直下は常に処理対象）
+    channels = find_channel_names(DATA_DIR)
+
+    # チャンネルごとにレポートを作成
+    for channel in channels:
+        create_channel_report(channel, start_date, end_date, profiler)
+
+    # プロファイル結果を出力
+    if profile:
+        try:
+            for path in profiler.write_reports(DATA_DIR, "create_excel"):
+                print(f"プロファイル結果を出力しました: {path}")
+        except Exception as e:
+            print(f"プロファイル結果の出力中にエラーが発生しました: {e}")
+        finally:
+            profiler.close()
+
+
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="メッセージからExcelレポートを作成")
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="処理段階ごとの時間とメモリを計測し、結果をDATA_DIRに出力する",
+    )
+    args = parser.parse_args()
+    main(profile=args.profile)
@@ -0,0 +1,252 @@
+# 処理段階（ステージ）ごとのプロファイリング機能
+# create_excel.py の --profile と、Webhookサーバーのリクエスト単位のプロファイルで使用する
+
+import io
+import os
+import re
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+# サマリーに出力する上位件数のデフォルト値
+DEFAULT_TOP_N = 20
+
+# folded形式の呼び出し経路を展開する最大の深さ
+MAX_STACK_DEPTH = 64
+
+# ステージ時間に対してこの割合より小さい経路はそれ以上展開しない
+MIN_STACK_RATIO = 0.001
+
+# 出力ファイル名に含まれる日時の形式（古いレポートの削除に使用）
+TIMESTAMP_PATTERN = re.compile(r"\d{8}_\d{6}_\d{6}")
+
+
+def _format_bytes(size):
+    """バイト数を読みやすい単位の文字列に変換"""
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
+def _remove_old_reports(output_dir, label, keep):
+    """同じラベルのレポートのうち、新しいものから keep 件を残して削除"""
+    prefix = f"profile_{label}_"
+    reports = {}
+    for filename in os.listdir(output_dir):
+        if not filename.startswith(prefix):
+            continue
+        timestamp = filename[len(prefix) : len(prefix) + 22]
+        if TIMESTAMP_PATTERN.fullmatch(timestamp):
+            reports.setdefault(timestamp, []).append(filename)
+
+    for timestamp in sorted(reports, reverse=True)[keep:]:
+        for filename in reports[timestamp]:
+            os.remove(os.path.join(output_dir, filename))
+
+
+def _take_snapshot():
+    """計測処理自身の確保を除いたtracemallocのスナップショットを取得"""
+    return tracemalloc.take_snapshot().filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+    )
+
+
+def _frame_label(func):
+    """pstatsの関数キーを folded 形式のフレーム名に変換"""
+    filename, lineno, name = func
+    if filename == "~":
+        # 組み込み関数
+        return name.replace(";", ":")
+    return f"{name} ({os.path.basename(filename)}:{lineno})".replace(";", ":")
+
+
+def _folded_stacks(stats, root):
+    """pstatsの呼び出し関係から flamegraph.pl 互換の folded 形式の行を生成
+
+    cProfileは呼び出し元と呼び出し先の組ごとの時間しか持たないため、
+    各関数の自己時間を呼び出し元の累積時間の比率で按分して経路を復元する。
+    """
+    total = sum(entry[2] for entry in stats.values())
+    min_weight = total * MIN_STACK_RATIO
+    folded = {}
+
+    def expand(func, weight, seen):
+        callers = {
+            caller: edge
+            for caller, edge in stats[func][4].items()
+            if caller in stats and caller not in seen
+        }
+        caller_total = sum(edge[3] for edge in callers.values())
+        if caller_total <= 0 or weight < min_weight or len(seen) >= MAX_STACK_DEPTH:
+            yield [_frame_label(func)], weight
+            return
+        for caller, edge in callers.items():
+            share = weight * edge[3] / caller_total
+            for path, path_weight in expand(caller, share, seen | {func}):
+                yield path + [_frame_label(func)], path_weight
+
+    for func, (_, _, tottime, _, _) in stats.items():
+        if tottime <= 0:
+            continue
+        for path, weight in expand(func, tottime, frozenset()):
+            key = ";".join([root] + path)
+            folded[key] = folded.get(key, 0.0) + weight
+
+    # 値はマイクロ秒の整数で出力する
+    return [
+        f"{stack} {round(weight * 1_000_000)}"
+        for stack, weight in sorted(folded.items())
+        if round(weight * 1_000_000) > 0
+    ]
+
+
+class StageProfiler:
+    """処理段階ごとにcProfileとtracemallocの計測結果を記録するクラス
+
+    無効な場合、stage() は何もしないコンテキストマネージャーを返す。
+    cProfileは同時に1つしか有効にできないため、ステージは入れ子にしないこと。
+    計測結果は write_reports() を呼んでも保持され、以降の計測に累積される。
+    計測を終えたら close() でtracemallocを停止する。
+    """
+
+    def __init__(self, enabled=False, top_n=DEFAULT_TOP_N):
+        self.enabled = enabled
+        self.top_n = top_n
+        self.stages = {}
+        self._started_tracemalloc = False
+
+    def stage(self, name):
+        """指定した名前のステージとして計測するコンテキストマネージャーを返す"""
+        if not self.enabled:
+            return nullcontext()
+        return self._measure(name)
+
+    @contextmanager
+    def _measure(self, name):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+        stage = self.stages.get(name)
+        if stage is None:
+            # 無効時の起動を軽くするため、cProfileは計測時にのみ読み込む
+            import cProfile
+
+            stage = {
+                "profile": cProfile.Profile(),
+                "calls": 0,
+                "wall_time": 0.0,
+                "memory_delta": 0,
+                "memory_peak": 0,
+                # 確保した場所 -> [サイズの増減, ブロック数の増減]
+                "allocations": {},
+            }
+            self.stages[name] = stage
+
+        snapshot_before = _take_snapshot()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        started = time.perf_counter()
+        stage["profile"].enable()
+        try:
+            yield
+        finally:
+            stage["profile"].disable()
+            stage["wall_time"] += time.perf_counter() - started
+            memory_current, memory_peak = tracemalloc.get_traced_memory()
+            stage["calls"] += 1
+            stage["memory_delta"] += memory_current - memory_before
+            stage["memory_peak"] = max(
+                stage["memory_peak"], memory_peak - memory_before
+            )
+
+            # ステージの開始時と終了時のスナップショットの差分を確保した場所ごとに累積
+            snapshot_after = _take_snapshot()
+            allocations = stage["allocations"]
+            for diff in snapshot_after.compare_to(snapshot_before, "lineno"):
+                if diff.size_diff == 0 and diff.count_diff == 0:
+                    continue
+                entry = allocations.setdefault(str(diff.traceback), [0, 0])
+                entry[0] += diff.size_diff
+                entry[1] += diff.count_diff
+
+    def close(self):
+        """このプロファイラーが開始したtracemallocを停止する"""
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def write_reports(self, output_dir, label, keep=None):
+        """計測結果をファイルに出力し、作成したファイルのパスのリストを返す
+
+        - profile_<label>_<日時>_<ステージ>.prof: pstats形式（snakeviz等で表示可能）
+        - profile_<label>_<日時>.folded: flamegraph.pl / speedscope 互換の folded 形式
+        - profile_<label>_<日時>_summary.txt: ステージごとの時間・メモリ確保の上位N件
+
+        keep を指定した場合、同じラベルのレポートは新しいものから keep 件だけ残す。
+        """
+        if not self.enabled or not self.stages:
+            return []
+
+        import pstats
+
+        os.makedirs(output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        prefix = os.path.join(output_dir, f"profile_{label}_{timestamp}")
+        paths = []
+        folded_lines = []
+        summary = io.StringIO()
+
+        summary.write(f"プロファイル: {label} ({timestamp})\n\n")
+        summary.write("ステージ別の集計\n")
+        for name, stage in self.stages.items():
+            summary.write(
+                f"  {name}: 実行回数 {stage['calls']}, "
+                f"経過時間 {stage['wall_time']:.3f}秒, "
+                f"メモリ増減 {_format_bytes(stage['memory_delta'])}, "
+                f"最大使用量 {_format_bytes(stage['memory_peak'])}\n"
+            )
+
+        for name, stage in self.stages.items():
+            prof_path = f"{prefix}_{name}.prof"
+            stage["profile"].dump_stats(prof_path)
+            paths.append(prof_path)
+
+            stats = pstats.Stats(stage["profile"], stream=summary)
+            folded_lines.extend(_folded_stacks(stats.stats, name))
+
+            summary.write(f"\n[{name}] 自己時間の上位{self.top_n}件\n")
+            stats.sort_stats("tottime").print_stats(self.top_n)
+
+            summary.write(f"[{name}] メモリ確保の増加が大きい上位{self.top_n}件\n")
+            allocations = sorted(
+                stage["allocations"].items(),
+                key=lambda item: item[1][0],
+                reverse=True,
+            )
+            for location, (size_diff, count_diff) in allocations[: self.top_n]:
+                summary.write(
+                    f"  {location}: {_format_bytes(size_diff)} "
+                    f"({count_diff:+d}ブロック)\n"
+                )
+
+        folded_path = f"{prefix}.folded"
+        with open(folded_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(folded_lines) + "\n")
+        paths.append(folded_path)
+
+        summary_path = f"{prefix}_summary.txt"
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        paths.append(summary_path)
+
+        if keep is not None:
+            _remove_old_reports(output_dir, label, keep)
+
+        return paths
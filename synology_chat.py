@@ -1,14 +1,27 @@
 # Synology ChatからのWebhookを受信し、メッセージをJSONファイルに保存するアプリケーション
 # Dockerコンテナとして実行することを前提とした設計
 
+import atexit
+import hmac
 import logging
 import os
 import json
+import signal
+import sys
+import threading
 from datetime import datetime, date
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
 
+from channels import (
+    get_channel_dir,
+    get_channel_names,
+    load_channel_tokens,
+    token_digest,
+)
+from profiling import StageProfiler
+
 # ログ設定
 fmt = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 logging.basicConfig(level=logging.DEBUG, format=fmt)
@@ -18,6 +31,16 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 token = os.getenv("SYNOLOGY_CHAT_TOKEN")
 timezone = os.getenv("TIMEZONE", "Asia/Tokyo")  # デフォルトは日本時間
+# リクエストのプロファイルを有効にする場合は1を指定
+profile_requests = os.getenv("WEBHOOK_PROFILE", "0") == "1"
+# プロファイル結果を出力する間隔（計測したリクエスト数）と保持するレポート数
+profile_interval = int(os.getenv("WEBHOOK_PROFILE_INTERVAL", 100))
+profile_keep = int(os.getenv("WEBHOOK_PROFILE_KEEP", 5))
+# 0以下では出力時の剰余計算や古いレポートの削除が正しく動作しないため起動しない
+if profile_interval < 1 or profile_keep < 1:
+    raise ValueError(
+        "WEBHOOK_PROFILE_INTERVAL と WEBHOOK_PROFILE_KEEP には1以上を指定してください"
+    )
 
 # Flaskアプリケーションの初期化
 app = Flask(__name__)
@@ -25,6 +48,10 @@ app = Flask(__name__)
 # JSONメッセージを保存するディレクトリ
 DATA_DIR = os.getenv("DATA_DIR", "data")
 
+# トークンのハッシュ値 -> (トークン, チャンネル名)
+# 同じトークンが複数のチャンネルに設定されている場合は起動しない
+channel_tokens = load_channel_tokens(os.getenv("SYNOLOGY_CHAT_TOKENS"), token)
+
 
 def get_period_start_end(dt):
     """日付から期間の開始日と終了日を取得"""
@@ -55,8 +82,20 @@ def get_period_filename(start_date, end_date, extension=".json"):
 
 
 def verify_token(received_token):
-    """トークンを検証する関数"""
-    return token == received_token
+    """トークンを検証し、対応するチャンネル名を返す関数（不一致の場合はNone）"""
+    if not isinstance(received_token, str) or not received_token:
+        return None
+
+    # ハッシュ値で対応表を引き、トークン本体は定数時間で比較する
+    entry = channel_tokens.get(token_digest(received_token))
+    if entry is None:
+        return None
+    expected_token, channel = entry
+    if not hmac.compare_digest(
+        expected_token.encode("utf-8"), received_token.encode("utf-8")
+    ):
+        return None
+    return channel
 
 
 @app.route("/webhook", methods=["POST"])
@@ -84,78 +123,147 @@ def webhook_receiver():
 
         # トークンの検証
         received_token = data.get("token")
-        logger.info(f"受信したトークン: {received_token}")
-        logger.info(f"期待するトークン: {token}")
+        channel = verify_token(received_token)
 
-        if not verify_token(received_token):
+        if channel is None:
             logger.warning("トークンが一致しません")
             error_resp = {"status": "error", "message": "Invalid token"}
             return jsonify(error_resp), 403
 
-        # 現在時刻を追加（タイムゾーン付き）
-        now = datetime.now(ZoneInfo(timezone))
-
-        # メッセージの送信時刻を取得（Synology Chatから提供される場合）
-        message_timestamp = data.get("timestamp")
-        message_time = None  # 初期値として None を設定
-        if message_timestamp:
-            try:
-                # Unix timestampをJST時刻に変換
-                message_time = datetime.fromtimestamp(
-                    float(message_timestamp), ZoneInfo(timezone)
-                )
-                data["message_time"] = message_time.isoformat()
-                logger.info(f"メッセージ送信時刻: {data['message_time']}")
-            except (ValueError, TypeError) as e:
-                logger.warning(f"送信時刻の解析に失敗: {e}")
-
-        # 受信時刻を記録
-        data["received_at"] = now.isoformat()
-        logger.info(f"メッセージ受信時刻: {data['received_at']}")
-
-        # 期間に基づいてファイル名を生成（メッセージ送信時刻を優先）
-        target_time = message_time if message_time is not None else now
-        start_date, end_date = get_period_start_end(target_time)
-
-        # ファイル名を生成
-        filename = get_period_filename(start_date, end_date)
-        current_file = os.path.join(DATA_DIR, filename)
-        logger.info(f"保存先ファイル: {filename}")
-
-        # メッセージファイルのディレクトリを確認
-        if not os.path.exists(DATA_DIR):
-            os.makedirs(DATA_DIR, exist_ok=True)
-            logger.info(f"ディレクトリを作成しました: {DATA_DIR}")
-
-        # 既存のメッセージを読み込む
-        messages = []
-        if os.path.exists(current_file):
-            try:
-                with open(current_file, "r", encoding="utf-8") as f:
-                    messages = json.load(f)
-            except Exception as e:
-                logger.error(f"メッセージファイルの読み込みに失敗しました: {e}")
-
-        # 新しいメッセージを追加
-        messages.append(data)
-
-        # メッセージを保存
-        with open(current_file, "w", encoding="utf-8") as f:
-            json.dump(messages, f, ensure_ascii=False, indent=2)
+        logger.info(f"チャンネル: {channel}")
 
-        logger.info(f"メッセージをファイルに保存しました: {current_file}")
-        return jsonify({"status": "ok", "message": "Message received"}), 200
+        # トークンが一致したリクエストのみを計測する
+        if profile_requests:
+            return profile_save_message(data, channel)
+        return save_message(data, channel)
 
     except Exception as e:
         logger.error(f"Webhookの処理中にエラーが発生しました: {e}", exc_info=True)
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def save_message(data, channel):
+    """メッセージをチャンネルの期間ごとのJSONファイルに保存する"""
+    channel_dir = get_channel_dir(DATA_DIR, channel)
+
+    # 現在時刻を追加（タイムゾーン付き）
+    now = datetime.now(ZoneInfo(timezone))
+
+    # メッセージの送信時刻を取得（Synology Chatから提供される場合）
+    message_timestamp = data.get("timestamp")
+    message_time = None  # 初期値として None を設定
+    if message_timestamp:
+        try:
+            # Unix timestampをJST時刻に変換
+            message_time = datetime.fromtimestamp(
+                float(message_timestamp), ZoneInfo(timezone)
+            )
+            data["message_time"] = message_time.isoformat()
+            logger.info(f"メッセージ送信時刻: {data['message_time']}")
+        except (ValueError, TypeError) as e:
+            logger.warning(f"送信時刻の解析に失敗: {e}")
+
+    # 受信時刻を記録
+    data["received_at"] = now.isoformat()
+    logger.info(f"メッセージ受信時刻: {data['received_at']}")
+
+    # 期間に基づいてファイル名を生成（メッセージ送信時刻を優先）
+    target_time = message_time if message_time is not None else now
+    start_date, end_date = get_period_start_end(target_time)
+
+    # ファイル名を生成
+    filename = get_period_filename(start_date, end_date)
+    current_file = os.path.join(channel_dir, filename)
+    logger.info(f"保存先ファイル: {current_file}")
+
+    # メッセージファイルのディレクトリを確認
+    if not os.path.exists(channel_dir):
+        os.makedirs(channel_dir, exist_ok=True)
+        logger.info(f"ディレクトリを作成しました: {channel_dir}")
+
+    # 既存のメッセージを読み込む
+    messages = []
+    if os.path.exists(current_file):
+        try:
+            with open(current_file, "r", encoding="utf-8") as f:
+                messages = json.load(f)
+        except Exception as e:
+            logger.error(f"メッセージファイルの読み込みに失敗しました: {e}")
+
+    # 新しいメッセージを追加
+    messages.append(data)
+
+    # メッセージを保存
+    with open(current_file, "w", encoding="utf-8") as f:
+        json.dump(messages, f, ensure_ascii=False, indent=2)
+
+    logger.info(f"メッセージをファイルに保存しました: {current_file}")
+    return jsonify({"status": "ok", "message": "Message received"}), 200
+
+
+# cProfileは同時に1つしか有効にできないため、計測は1リクエストずつ行い、
+# 計測中やレポート出力中に届いたリクエストは計測せずに処理する。
+# ただしtracemallocは全スレッドのメモリ確保を記録し、Python 3.12以降はcProfileも
+# 全スレッドの呼び出しを記録するため、同時に処理された他のリクエストの分も含まれる。
+_profile_lock = threading.Lock()
+
+# リクエスト全体で共有し、計測結果を累積するプロファイラー
+request_profiler = StageProfiler(enabled=profile_requests)
+_profiled_requests = 0
+
+
+def profile_save_message(data, channel):
+    """計測しながらメッセージを保存し、一定件数ごとにレポートを出力する"""
+    global _profiled_requests
+
+    if not _profile_lock.acquire(blocking=False):
+        return save_message(data, channel)
+
+    try:
+        with request_profiler.stage("save_message"):
+            response = save_message(data, channel)
+        _profiled_requests += 1
+        write_now = _profiled_requests % profile_interval == 0
+    finally:
+        _profile_lock.release()
+
+    # ファイル出力でレスポンスを遅らせないよう、別スレッドで出力する
+    if write_now:
+        threading.Thread(target=write_profile_reports, daemon=True).start()
+    return response
+
+
+def write_profile_reports():
+    """累積したプロファイル結果をDATA_DIRに出力する"""
+    with _profile_lock:
+        try:
+            paths = request_profiler.write_reports(
+                DATA_DIR, "webhook", keep=profile_keep
+            )
+            for path in paths:
+                logger.info(f"プロファイル結果を出力しました: {path}")
+        except Exception as e:
+            logger.error(f"プロファイル結果の出力中にエラーが発生しました: {e}")
+
+
 def run_server(host="0.0.0.0", port=5001):
     """Webhookサーバーを実行する関数"""
     logger.info(f"Webhookサーバーを起動します: http://{host}:{port}/webhook")
     logger.info(f"メッセージの保存先ディレクトリ: {DATA_DIR}")
     logger.info(f"使用タイムゾーン: {timezone}")
+    if profile_requests:
+        logger.info(
+            f"{profile_interval}リクエストごとと停止時に"
+            f"プロファイル結果を出力します: {DATA_DIR}"
+        )
+        # docker stop のSIGTERMでも停止時の出力が行われるようにする
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        atexit.register(write_profile_reports)
+    channels = get_channel_names(channel_tokens)
+    if channels:
+        logger.info(f"受信対象チャンネル: {', '.join(channels)}")
+    else:
+        logger.warning("トークンが設定されていません。すべてのリクエストを拒否します")
     app.run(host=host, port=port, debug=False)
 
 